@@ -5,31 +5,160 @@ Extracts winning numbers from lottery result images using GPT-4o Vision
 """
 
 import os
+import argparse
+import asyncio
 import base64
+import hashlib
 import re
 import json
+import logging
+import queue
 import time
 import requests
+import aiofiles
+import orjson
+from io import BytesIO
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional
 from datetime import datetime
-from openai import OpenAI
+from PIL import Image
+from pdf2image import convert_from_path
+from openai import AsyncOpenAI, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 # Configuration
 PDF_DIR = "/tmp/vietlott_pdfs"
 IMAGE_DIR = "/tmp/vietlott_images"
+CACHE_DIR = "/tmp/vietlott_ocr_cache"
 OUTPUT_DIR = "data/draws/power_6_55"
 BASE_URL = "https://vietlott.vn/vi/trung-thuong/ket-qua-trung-thuong/thong-bao-ket-qua-655?pageindex={}&nocatche=1"
 TOTAL_PAGES = 5
+MAX_CONCURRENT_REQUESTS = 5  # In-flight Vision API calls
+REQUESTS_PER_MINUTE = 500  # OpenAI GPT-4o tier 1 limits
+TOKENS_PER_MINUTE = 30000
+ESTIMATED_TOKENS_PER_REQUEST = 1600  # Prompt + high-detail page image (~1100 tokens) + max_tokens
+BATCH_SIZE = 4  # Images sent per Vision request
+WRITE_BATCH_SIZE = 32  # Draw files queued before a batched write
+MAX_IMAGE_EDGE = 1024  # Longest edge in pixels sent to the Vision API
+
+logger = logging.getLogger("vietlott_ocr")
+
+# JSON schema the Vision API must follow for a single draw
+DRAW_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["date", "numbers"],
+    "properties": {
+        "date": {"type": "string", "pattern": "^\\d{2}/\\d{2}/\\d{4}$"},
+        "numbers": {
+            "type": "array",
+            "minItems": 6,
+            "maxItems": 6,
+            "items": {"type": "integer", "minimum": 1, "maximum": 55},
+        },
+    },
+}
+
+# JSON schema for a batched request, one draw per labeled image
+BATCH_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["results"],
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["image", "date", "numbers"],
+                "properties": {"image": {"type": "integer"}, **DRAW_SCHEMA["properties"]},
+            },
+        },
+    },
+}
+
+# Vision prompts; the batched prompt is formatted with the number of images
+OCR_PROMPT = (
+    "This is a Vietlott Power 6/55 lottery result image. "
+    "Please extract:\n"
+    "1. The draw date (ngày mở thưởng) - shown in DD/MM/YYYY format\n"
+    "2. The 6 winning numbers\n\n"
+    "The numbers are typically displayed as 6 two-digit numbers ranging from 01 to 55.\n"
+    "Look for numbers that are often:\n"
+    "- Displayed in a grid or circle pattern\n"
+    "- Separated by dashes, spaces, or arranged vertically\n"
+    "- Sometimes labeled as 'Bộ số' (winning numbers)\n\n"
+    "Return the date as DD/MM/YYYY and the numbers as integers."
+)
+BATCH_OCR_PROMPT = (
+    "These are {count} Vietlott Power 6/55 lottery result images, labeled Image 1 to Image {count}. "
+    "For each image, extract:\n"
+    "1. The draw date (ngày mở thưởng) - shown in DD/MM/YYYY format\n"
+    "2. The 6 winning numbers, ranging from 01 to 55 and sometimes labeled as 'Bộ số'\n\n"
+    "Return one result per image, with image set to its label number."
+)
+
+DRAW_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "draw", "strict": True, "schema": DRAW_SCHEMA}
+}
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "draws", "strict": True, "schema": BATCH_SCHEMA}
+}
+
+# Precompiled patterns for parsing ChatGPT responses
+_DATE_RE = re.compile(r'Date:\s*(\d{2})/(\d{2})/(\d{4})')
+
+class RateLimiter:
+    """Token-bucket limiter for OpenAI requests-per-minute and tokens-per-minute quotas"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = float(requests_per_minute)
+        self.available_tokens = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        """Top up both buckets for the time elapsed since the last refill"""
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.available_requests = min(self.requests_per_minute,
+                                      self.available_requests + elapsed * self.requests_per_minute / 60)
+        self.available_tokens = min(self.tokens_per_minute,
+                                    self.available_tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, estimated_tokens: int):
+        """Wait until one request and estimated_tokens are available, then consume them"""
+        # Holding the lock while sleeping keeps callers served in FIFO order
+        async with self.lock:
+            while True:
+                self.refill()
+                if self.available_requests >= 1 and self.available_tokens >= estimated_tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= estimated_tokens
+                    return
+
+                wait = max((1 - self.available_requests) * 60 / self.requests_per_minute,
+                           (estimated_tokens - self.available_tokens) * 60 / self.tokens_per_minute)
+                await asyncio.sleep(wait)
 
 class VietlottChatGPTOCR:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, force: bool = False):
         """
         Initialize with OpenAI API key
         Get your API key from: https://platform.openai.com/api-keys
+        Set force to re-OCR draws that already have a JSON file, bypassing the response cache
         """
+        self.force = force
+
         if api_key:
-            self.client = OpenAI(api_key=api_key)
+            self.aclient = AsyncOpenAI(api_key=api_key)
         else:
             # Try to get from environment variable
             api_key = os.environ.get("OPENAI_API_KEY")
@@ -39,107 +168,275 @@ class VietlottChatGPTOCR:
                     "Get your API key from: https://platform.openai.com/api-keys\n"
                     "Then set it as: export OPENAI_API_KEY='your-api-key-here'"
                 )
-            self.client = OpenAI(api_key=api_key)
+            self.aclient = AsyncOpenAI(api_key=api_key)
+
+        self.cache_dir = Path(CACHE_DIR)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Immutable request parts, built once and shared by every Vision call
+        self.prompt_part = {"type": "text", "text": OCR_PROMPT}
+        self.batch_prompt_parts = {
+            count: {"type": "text", "text": BATCH_OCR_PROMPT.format(count=count)}
+            for count in range(2, BATCH_SIZE + 1)
+        }
+        self.image_label_parts = [{"type": "text", "text": f"Image {index}:"} for index in range(1, BATCH_SIZE + 1)]
+
+        # Draw files are queued and written in batches across a small thread pool
+        self.pending_writes = []
+        self.write_failures = 0
+        self.writer = ThreadPoolExecutor(max_workers=8)
 
+        self.sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
         self.existing_draws = self.get_existing_draws()
         print(f"✓ OpenAI client initialized")
         print(f"✓ Found {len(self.existing_draws)} existing draws")
 
     def get_existing_draws(self) -> set:
         """Get set of existing draw IDs"""
-        existing = set()
-        output_path = Path(OUTPUT_DIR)
-        if output_path.exists():
-            for file in output_path.glob("power_*.json"):
-                existing.add(file.stem)
-        return existing
-
-    def encode_image(self, image_path: str) -> str:
-        """Encode image to base64"""
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-
-    def extract_numbers_with_chatgpt(self, image_path: str, draw_number: int) -> tuple[List[int], Optional[datetime]]:
-        """Extract winning numbers and date using ChatGPT Vision API"""
-
-        print(f"  [{draw_number:05d}] Analyzing with ChatGPT Vision...")
+        try:
+            entries = os.scandir(OUTPUT_DIR)
+        except FileNotFoundError:
+            return set()
+
+        with entries:
+            return {entry.name[:-5] for entry in entries
+                    if entry.name.startswith("power_") and entry.name.endswith(".json")}
+
+    def preprocess_image(self, image_bytes: bytes) -> bytes:
+        """Downscale the full result page, returns JPEG bytes"""
+        with Image.open(BytesIO(image_bytes)) as img:
+            img = img.convert("RGB")
+            img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+
+            buffer = BytesIO()
+            img.save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue()
+
+    async def load_image(self, image_path: str) -> bytes:
+        """Read and preprocess image"""
+        async with aiofiles.open(image_path, "rb") as image_file:
+            image_bytes = await image_file.read()
+        return await asyncio.to_thread(self.preprocess_image, image_bytes)
+
+    def encode_image(self, image_bytes: bytes) -> str:
+        """Encode preprocessed image bytes as a base64 data URL"""
+        # Concatenate as bytes and decode once; ASCII decoding is cheaper than UTF-8
+        return (b"data:image/jpeg;base64," + base64.b64encode(image_bytes)).decode('ascii')
+
+    def load_cached_response(self, cache_file: Path) -> Optional[dict]:
+        """Load a cached OCR response, or None on a cache miss"""
+        if not cache_file.exists():
+            return None
+        with open(cache_file) as f:
+            return json.load(f)
+
+    def save_cached_response(self, cache_file: Path, ocr_text: str, numbers: List[int], draw_date: Optional[datetime]):
+        """Atomically write the raw response and parsed fields to the OCR cache"""
+        entry = {
+            "ocr_text": ocr_text,
+            "numbers": numbers,
+            "draw_date": draw_date.isoformat() if draw_date else None,
+        }
 
-        # Read and encode image
-        base64_image = self.encode_image(image_path)
+        tmp_file = cache_file.with_suffix(".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, cache_file)
+
+    @retry(
+        retry=retry_if_exception_type(RateLimitError),
+        wait=wait_exponential(min=1, max=30),
+        stop=stop_after_attempt(5),
+    )
+    async def create_completion(self, estimated_tokens: int = ESTIMATED_TOKENS_PER_REQUEST, **kwargs):
+        """Call the Chat Completions API, capped at MAX_CONCURRENT_REQUESTS in flight, throttled by the rate limiter and retried on 429"""
+        async with self.sem:
+            await self.limiter.acquire(estimated_tokens)
+            return await self.aclient.chat.completions.create(**kwargs)
+
+    async def request_ocr_text(self, image_bytes: bytes) -> str:
+        """Send a preprocessed image to ChatGPT Vision API and return the raw JSON response"""
+        image_part = {
+            "type": "image_url",
+            "image_url": {
+                "url": self.encode_image(image_bytes),
+                "detail": "high"
+            }
+        }
 
         # Call GPT-4o Vision API
-        response = self.client.chat.completions.create(
+        response = await self.create_completion(
             model="gpt-4o",  # GPT-4o has excellent vision capabilities
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": (
-                                "This is a Vietlott Power 6/55 lottery result image. "
-                                "Please extract:\n"
-                                "1. The draw date (ngày mở thưởng) - shown in DD/MM/YYYY format\n"
-                                "2. The 6 winning numbers\n\n"
-                                "The numbers are typically displayed as 6 two-digit numbers ranging from 01 to 55.\n"
-                                "Look for numbers that are often:\n"
-                                "- Displayed in a grid or circle pattern\n"
-                                "- Separated by dashes, spaces, or arranged vertically\n"
-                                "- Sometimes labeled as 'Bộ số' (winning numbers)\n\n"
-                                "Return in this exact format:\n"
-                                "Date: DD/MM/YYYY\n"
-                                "Numbers: 01, 15, 23, 34, 42, 55"
-                            )
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
+            messages=[{"role": "user", "content": [self.prompt_part, image_part]}],
+            response_format=DRAW_RESPONSE_FORMAT,
             max_tokens=300,
             temperature=0
         )
 
-        # Extract response text
-        ocr_text = response.choices[0].message.content.strip()
-        print(f"  [{draw_number:05d}] ChatGPT Response: {ocr_text}")
+        # Strict json_schema replies carry a refusal instead of content; an empty text parses as a failed OCR
+        message = response.choices[0].message
+        if message.content is None:
+            logger.warning(f"  ⚠ ChatGPT refused the request: {message.refusal}")
+            return ""
+
+        return message.content.strip()
+
+    async def request_batch_ocr_texts(self, images: List[bytes]) -> Optional[List[str]]:
+        """Send several preprocessed images in one Vision request, returns None if the reply is unusable"""
+        count = len(images)
+        content = [self.batch_prompt_parts[count]]
+        for label_part, image_bytes in zip(self.image_label_parts, images):
+            content.append(label_part)
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": self.encode_image(image_bytes),
+                    "detail": "high"
+                }
+            })
+
+        response = await self.create_completion(
+            estimated_tokens=ESTIMATED_TOKENS_PER_REQUEST * count,
+            model="gpt-4o",
+            messages=[{"role": "user", "content": content}],
+            response_format=BATCH_RESPONSE_FORMAT,
+            max_tokens=800,
+            temperature=0
+        )
+
+        # Split into one single-draw JSON object per image so caching and parsing stay uniform
+        try:
+            data = json.loads(response.choices[0].message.content)
+            by_image = {entry["image"]: entry for entry in data["results"]}
+            return [
+                json.dumps({"date": by_image[index]["date"], "numbers": by_image[index]["numbers"]})
+                for index in range(1, count + 1)
+            ]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    async def extract_batch_with_chatgpt_async(self, images: List[tuple[int, str]]) -> List[tuple[List[int], Optional[datetime]]]:
+        """Extract winning numbers and dates for (draw_number, image_path) pairs using ChatGPT Vision API"""
+
+        # Read and preprocess images; an unreadable image only fails its own draw
+        image_bytes = await asyncio.gather(*(self.load_image(path) for _, path in images), return_exceptions=True)
+
+        # Identical image bytes always produce the same answer, so reuse earlier responses
+        cache_files = [None] * len(images)
+        ocr_texts = [None] * len(images)
+        misses = []
+        for i, data in enumerate(image_bytes):
+            if isinstance(data, Exception):
+                logger.error(f"  [{images[i][0]:05d}] ✗ Error loading image: {data}")
+                continue
+
+            cache_files[i] = self.cache_dir / f"{hashlib.sha256(data).hexdigest()}.json"
+            # A forced run asks the API again and refreshes the cache
+            cached = None if self.force else self.load_cached_response(cache_files[i])
+            if cached is not None:
+                logger.info(f"  [{images[i][0]:05d}] Using cached ChatGPT response")
+                ocr_texts[i] = cached["ocr_text"]
+            else:
+                misses.append(i)
+
+        if misses:
+            for i in misses:
+                logger.info(f"  [{images[i][0]:05d}] Analyzing with ChatGPT Vision...")
+
+            # Send the misses together, falling back to one request per image if the batch reply is unusable
+            texts = None
+            if len(misses) > 1:
+                texts = await self.request_batch_ocr_texts([image_bytes[i] for i in misses])
+            if texts is None:
+                # Keep replies that succeeded even if another image in the group fails
+                texts = await asyncio.gather(*(self.request_ocr_text(image_bytes[i]) for i in misses),
+                                             return_exceptions=True)
+
+            for i, ocr_text in zip(misses, texts):
+                if isinstance(ocr_text, Exception):
+                    logger.error(f"  [{images[i][0]:05d}] ✗ Error: {ocr_text}")
+                    continue
+                logger.debug(f"  [{images[i][0]:05d}] ChatGPT Response: {ocr_text}")
+                ocr_texts[i] = ocr_text
+
+        results = []
+        for i, ocr_text in enumerate(ocr_texts):
+            if ocr_text is None:
+                results.append(([], None))
+                continue
+
+            # Parse date and numbers from response (re-parsed on cache hits so parser fixes apply)
+            numbers, draw_date = self.parse_ocr_response(ocr_text)
+
+            # Only cache complete parses so bad or truncated replies are retried on the next run
+            if i in misses and len(numbers) == 6 and draw_date is not None:
+                self.save_cached_response(cache_files[i], ocr_text, numbers, draw_date)
+
+            results.append((numbers, draw_date))
 
-        # Parse date and numbers from response
-        draw_date = self.parse_date_from_response(ocr_text)
-        numbers = self.parse_numbers_from_response(ocr_text)
+        return results
+
+    def parse_ocr_response(self, text: str, lo: int = 1, hi: int = 55) -> tuple[List[int], Optional[datetime]]:
+        """Parse numbers and date from a structured JSON response, returns ([], None) if the JSON is invalid"""
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            # Responses cached before structured output are plain "Date: ... Numbers: ..." text
+            return self.parse_numbers_from_response(text, lo, hi), self.parse_date_from_response(text)
+
+        # Valid JSON with a bad date or numbers is a failed OCR, never rescanned as text
+        try:
+            numbers = sorted(set(data["numbers"]))
+            draw_date = datetime.strptime(data["date"], "%d/%m/%Y").replace(hour=18)
+        except (ValueError, KeyError, TypeError):
+            return [], None
+
+        if len(numbers) != 6 or not all(isinstance(n, int) and lo <= n <= hi for n in numbers):
+            return [], None
 
         return numbers, draw_date
 
     def parse_date_from_response(self, text: str) -> Optional[datetime]:
         """Parse draw date from ChatGPT response"""
+        # Cheap substring check before running the regex
+        if "Date:" not in text:
+            return None
+
         # Look for date pattern DD/MM/YYYY
-        date_match = re.search(r'Date:\s*(\d{2})/(\d{2})/(\d{4})', text)
+        date_match = _DATE_RE.search(text)
         if date_match:
             day, month, year = map(int, date_match.groups())
             return datetime(year, month, day, 18, 0, 0)
         return None
 
-    def parse_numbers_from_response(self, text: str) -> List[int]:
-        """Parse 6 numbers from ChatGPT response"""
+    def parse_numbers_from_response(self, text: str, lo: int = 1, hi: int = 55) -> List[int]:
+        """Parse 6 numbers from ChatGPT response in a single pass over the text"""
 
-        # Remove common separators and split
-        text = text.replace('-', ' ').replace(',', ' ').replace('  ', ' ')
-        parts = text.split()
+        # Start after the "Numbers:" label so digits in the date line are not picked up
+        start = text.find("Numbers:")
+        if start < 0:
+            start = 0
 
         numbers = []
-        for part in parts:
-            # Try to extract number from each part
-            match = re.search(r'\d+', part)
-            if match:
-                num = int(match.group())
-                if 1 <= num <= 55 and num not in numbers:
+        seen = 0  # Bitmask of numbers already collected
+        num = 0
+        in_num = False
+        end = len(text)
+        for i in range(start, end + 1):
+            # Treat end of text as a separator so a trailing number is flushed
+            digit = ord(text[i]) - 48 if i < end else -1
+            if 0 <= digit <= 9:
+                num = num * 10 + digit
+                in_num = True
+            elif in_num:
+                if lo <= num <= hi and not (seen >> num) & 1:
+                    seen |= 1 << num
                     numbers.append(num)
                     if len(numbers) == 6:
                         break
+                num = 0
+                in_num = False
 
         # Sort the numbers
         numbers.sort()
@@ -147,20 +444,21 @@ class VietlottChatGPTOCR:
         return numbers
 
     def convert_pdf_to_image(self, pdf_path: str, draw_number: int) -> str:
-        """Convert PDF to image using pdftoppm"""
-        image_base = os.path.join(IMAGE_DIR, f"draw_{draw_number:05d}")
-        image_path = f"{image_base}.png"
+        """Convert PDF to image using pdf2image"""
+        image_name = f"draw_{draw_number:05d}"
+        image_path = os.path.join(IMAGE_DIR, f"{image_name}.png")
 
         if os.path.exists(image_path):
             return image_path
 
-        # Use pdftoppm to convert
-        import subprocess
-        cmd = ["pdftoppm", "-png", "-singlefile", pdf_path, image_base]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            raise Exception(f"pdftoppm failed: {result.stderr}")
+        convert_from_path(
+            pdf_path,
+            output_folder=IMAGE_DIR,
+            output_file=image_name,
+            fmt="png",
+            single_file=True,
+            paths_only=True,
+        )
 
         if not os.path.exists(image_path):
             raise Exception(f"Image not created: {image_path}")
@@ -168,7 +466,7 @@ class VietlottChatGPTOCR:
         return image_path
 
     def save_draw(self, draw_number: int, numbers: List[int], draw_date: datetime):
-        """Save draw to JSON file"""
+        """Serialize draw and queue it for the next batched write"""
         draw = {
             "id": f"power_{draw_number:05d}",
             "game_type": "POWER_6_55",
@@ -180,14 +478,71 @@ class VietlottChatGPTOCR:
         filename = f"power_{draw_number:05d}.json"
         filepath = os.path.join(OUTPUT_DIR, filename)
 
-        with open(filepath, 'w') as f:
-            json.dump(draw, f, indent=2)
-
-        print(f"  ✓ Saved: {numbers}")
-
-    def process_existing_images(self, limit: int = None):
+        self.pending_writes.append((draw_number, numbers, filepath, orjson.dumps(draw, option=orjson.OPT_INDENT_2)))
+
+    @staticmethod
+    def write_file(filepath: str, data: bytes):
+        """Write bytes to a file (runs in the writer thread pool)"""
+        with open(filepath, 'wb') as f:
+            f.write(data)
+
+    async def flush_draws(self):
+        """Write all queued draw files in one batch across the writer thread pool, counting failed writes"""
+        writes, self.pending_writes = self.pending_writes, []
+        if not writes:
+            return
+
+        loop = asyncio.get_running_loop()
+        outcomes = await asyncio.gather(*(loop.run_in_executor(self.writer, self.write_file, filepath, data)
+                                          for _, _, filepath, data in writes), return_exceptions=True)
+
+        # Report each draw only once its file is actually on disk
+        for (draw_number, numbers, _, _), outcome in zip(writes, outcomes):
+            if isinstance(outcome, Exception):
+                self.write_failures += 1
+                logger.error(f"  [{draw_number:05d}] ✗ Error writing draw: {outcome}")
+            else:
+                logger.info(f"  [{draw_number:05d}] ✓ Saved: {numbers}")
+
+    def save_result(self, draw_number: int, numbers: List[int], draw_date: Optional[datetime]) -> bool:
+        """Queue a draw for saving if OCR found a date and 6 numbers, returns True if queued"""
+        if len(numbers) == 6 and draw_date is not None:
+            self.save_draw(draw_number, numbers, draw_date)
+            return True
+
+        if draw_date is None:
+            logger.warning(f"  [{draw_number:05d}] ⚠ Could not extract date")
+        if len(numbers) != 6:
+            logger.warning(f"  [{draw_number:05d}] ⚠ Could not extract 6 numbers (got {len(numbers)})")
+        return False
+
+    async def process_batch(self, image_files: List[Path]) -> List[bool]:
+        """OCR a batch of images and save the draws, returns True for each saved draw"""
+        draw_numbers = [int(image_file.stem.split("_")[1]) for image_file in image_files]
+
+        try:
+            # Extract numbers and dates using ChatGPT Vision
+            results = await self.extract_batch_with_chatgpt_async(
+                [(draw_number, str(image_file)) for draw_number, image_file in zip(draw_numbers, image_files)]
+            )
+        except Exception as e:
+            for draw_number in draw_numbers:
+                logger.error(f"  [{draw_number:05d}] ✗ Error: {e}")
+            return [False] * len(image_files)
+
+        saved = [
+            self.save_result(draw_number, numbers, draw_date)
+            for draw_number, (numbers, draw_date) in zip(draw_numbers, results)
+        ]
+
+        if len(self.pending_writes) >= WRITE_BATCH_SIZE:
+            await self.flush_draws()
+
+        return saved
+
+    async def process_existing_images(self, limit: int = None):
         """Process already converted images with ChatGPT Vision"""
-        print("\n=== Processing Images with ChatGPT Vision ===\n")
+        logger.info("=== Processing Images with ChatGPT Vision ===")
 
         os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -197,56 +552,66 @@ class VietlottChatGPTOCR:
         if limit:
             image_files = image_files[:limit]
 
-        total_draws = 0
-        saved_draws = 0
-        failed_draws = 0
-
+        # Skip draws that are already saved unless forced, before any API work
+        pending = []
         for image_file in image_files:
             draw_number = int(image_file.stem.split("_")[1])
 
             draw_id = f"power_{draw_number:05d}"
             if draw_id in self.existing_draws:
-                print(f"  [{draw_number:05d}] Updating existing draw (fixing date)...")
-
-            try:
-                # Extract numbers and date using ChatGPT Vision
-                numbers, draw_date = self.extract_numbers_with_chatgpt(str(image_file), draw_number)
-
-                if len(numbers) == 6 and draw_date is not None:
-                    self.save_draw(draw_number, numbers, draw_date)
-                    saved_draws += 1
-                else:
-                    if draw_date is None:
-                        print(f"  [{draw_number:05d}] ⚠ Could not extract date")
-                    if len(numbers) != 6:
-                        print(f"  [{draw_number:05d}] ⚠ Could not extract 6 numbers (got {len(numbers)})")
-                    failed_draws += 1
-
-                total_draws += 1
-
-                # Rate limiting - avoid hitting API limits
-                time.sleep(1)
-
-            except Exception as e:
-                print(f"  [{draw_number:05d}] ✗ Error: {e}")
-                failed_draws += 1
-                continue
-
-        print(f"\n=== Summary ===")
-        print(f"Processed: {total_draws} images")
-        print(f"Saved: {saved_draws} new draws")
-        print(f"Failed: {failed_draws} draws")
-        print(f"\nAPI Cost: ~${saved_draws * 0.01:.2f} USD (GPT-4o Vision: ~$0.01 per image)")
+                if not self.force:
+                    logger.info(f"  [{draw_number:05d}] Skipping (already exists)")
+                    continue
+                logger.info(f"  [{draw_number:05d}] Updating existing draw (fixing date)...")
+
+            pending.append(image_file)
+
+        # Send BATCH_SIZE images per request, capped at MAX_CONCURRENT_REQUESTS in-flight calls
+        batches = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+        try:
+            batch_results = await asyncio.gather(*(self.process_batch(batch) for batch in batches))
+        finally:
+            await self.flush_draws()
+            self.writer.shutdown()
+        results = [saved for batch in batch_results for saved in batch]
+
+        total_draws = len(results)
+        saved_draws = sum(results) - self.write_failures
+        failed_draws = total_draws - saved_draws
+
+        logger.info("=== Summary ===")
+        logger.info(f"Processed: {total_draws} images")
+        logger.info(f"Saved: {saved_draws} new draws")
+        logger.info(f"Failed: {failed_draws} draws")
+        logger.info(f"API Cost: ~${saved_draws * 0.01:.2f} USD (GPT-4o Vision: ~$0.01 per image)")
+
+def setup_logging(verbose: bool = False) -> QueueListener:
+    """Route log records through a queue so async workers never block on terminal I/O"""
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    # Libraries (e.g. httpx request lines) only surface warnings; our progress is INFO, or DEBUG with --verbose
+    logging.basicConfig(level=logging.WARNING, handlers=[queue_handler])
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    listener = QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    return listener
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description="Vietlott Power 6/55 ChatGPT Vision OCR")
+    parser.add_argument("--force", action="store_true", help="re-OCR draws that already exist")
+    parser.add_argument("--verbose", action="store_true", help="log raw ChatGPT responses")
+    args = parser.parse_args()
+    listener = setup_logging(args.verbose)
+
     print("=" * 60)
     print("Vietlott Power 6/55 - ChatGPT Vision OCR Crawler")
     print("=" * 60)
     print()
 
     try:
-        ocr = VietlottChatGPTOCR()
+        ocr = VietlottChatGPTOCR(force=args.force)
 
         # Ask user how many images to process
         print("\nHow many images would you like to process?")
@@ -267,7 +632,7 @@ def main():
             else:
                 print(f"\nProcessing {limit} images...")
 
-        ocr.process_existing_images(limit=limit)
+        asyncio.run(ocr.process_existing_images(limit=limit))
 
     except Exception as e:
         print(f"\n✗ Error: {e}")
@@ -276,7 +641,9 @@ def main():
         print("   export OPENAI_API_KEY='sk-proj-...'")
         print("2. Get your API key from: https://platform.openai.com/api-keys")
         print("3. Install required packages:")
-        print("   pip3 install openai")
+        print("   pip3 install openai aiofiles tenacity pillow pdf2image orjson")
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     main()
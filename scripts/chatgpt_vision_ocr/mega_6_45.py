@@ -5,29 +5,168 @@ Downloads PDFs, converts to images, and extracts winning numbers using GPT-4o Vi
 """
 
 import os
+import argparse
+import asyncio
 import base64
+import hashlib
 import re
 import json
+import logging
+import multiprocessing
+import queue
 import time
+from bisect import bisect_left
 import requests
-import subprocess
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import aiofiles
+import orjson
+import aiohttp
+from io import BytesIO
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional, Tuple
 from datetime import datetime
-from openai import OpenAI
+from PIL import Image
+from pdf2image import convert_from_path
+from openai import AsyncOpenAI, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 # Configuration
 PDF_DIR = "/tmp/vietlott_pdfs_mega"
 IMAGE_DIR = "/tmp/vietlott_images_mega"
+CACHE_DIR = "/tmp/vietlott_ocr_cache_mega"
+PAGE_CACHE_FILE = "/tmp/vietlott_page_cache_mega.json"  # ETag/Last-Modified and parsed links per listing page
 OUTPUT_DIR = "data/draws/mega_6_45"
 BASE_URL = "https://vietlott.vn/vi/trung-thuong/ket-qua-trung-thuong/thong-bao-ket-qua-645?pageindex={}&nocatche=1"
 TOTAL_PAGES = 5  # Adjust to get more draws
+MAX_CONCURRENT_REQUESTS = 5  # In-flight Vision API calls
+MAX_CONCURRENT_DOWNLOADS = 4  # In-flight PDF downloads from vietlott.vn
+REQUESTS_PER_MINUTE = 500  # OpenAI GPT-4o tier 1 limits
+TOKENS_PER_MINUTE = 30000
+ESTIMATED_TOKENS_PER_REQUEST = 1600  # Prompt + high-detail page image (~1100 tokens) + max_tokens
+BATCH_SIZE = 4  # Images sent per Vision request
+WRITE_BATCH_SIZE = 32  # Draw files queued before a batched write
+MAX_IMAGE_EDGE = 1024  # Longest edge in pixels sent to the Vision API
+
+logger = logging.getLogger("vietlott_ocr")
+
+# JSON schema the Vision API must follow for a single draw
+DRAW_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["date", "numbers"],
+    "properties": {
+        "date": {"type": "string", "pattern": "^\\d{2}/\\d{2}/\\d{4}$"},
+        "numbers": {
+            "type": "array",
+            "minItems": 6,
+            "maxItems": 6,
+            "items": {"type": "integer", "minimum": 1, "maximum": 45},
+        },
+    },
+}
+
+# JSON schema for a batched request, one draw per labeled image
+BATCH_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["results"],
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["image", "date", "numbers"],
+                "properties": {"image": {"type": "integer"}, **DRAW_SCHEMA["properties"]},
+            },
+        },
+    },
+}
+
+# Vision prompts; the batched prompt is formatted with the number of images
+OCR_PROMPT = (
+    "This is a Vietlott Mega 6/45 lottery result image. "
+    "Please extract:\n"
+    "1. The draw date (ngày mở thưởng) - shown in DD/MM/YYYY format\n"
+    "2. The 6 winning numbers\n\n"
+    "The numbers range from 01 to 45 (not 55!). "
+    "Look for numbers that are often:\n"
+    "- Displayed in a grid or circle pattern\n"
+    "- Separated by dashes, spaces, or arranged vertically\n"
+    "- Sometimes labeled as 'Bộ số' (winning numbers)\n\n"
+    "IMPORTANT: Only extract numbers between 01-45. If you see numbers like 46-55, "
+    "those are from Power 6/55, not Mega 6/45. Look for the 6 main numbers.\n\n"
+    "Return the date as DD/MM/YYYY and the numbers as integers."
+)
+BATCH_OCR_PROMPT = (
+    "These are {count} Vietlott Mega 6/45 lottery result images, labeled Image 1 to Image {count}. "
+    "For each image, extract:\n"
+    "1. The draw date (ngày mở thưởng) - shown in DD/MM/YYYY format\n"
+    "2. The 6 winning numbers, ranging from 01 to 45 (not 55!) and sometimes labeled as 'Bộ số'\n\n"
+    "Return one result per image, with image set to its label number."
+)
+
+DRAW_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "draw", "strict": True, "schema": DRAW_SCHEMA}
+}
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "draws", "strict": True, "schema": BATCH_SCHEMA}
+}
+
+# Precompiled patterns for parsing ChatGPT responses
+_DATE_RE = re.compile(r'Date:\s*(\d{2})/(\d{2})/(\d{4})')
+
+# Precompiled patterns for scraping announcement pages
+_PDF_RE = re.compile(r'https://media\.vietlott\.vn/[^\s]*\[645\][^\s]*\.pdf')
+_DRAW_RE = re.compile(r'\[645\]---(\d+)---')
+_SNIPPET_DATE_RE = re.compile(r'Ngày\s+(\d{2})/(\d{2})/(\d{4})')
+
+class RateLimiter:
+    """Token-bucket limiter for OpenAI requests-per-minute and tokens-per-minute quotas"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = float(requests_per_minute)
+        self.available_tokens = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        """Top up both buckets for the time elapsed since the last refill"""
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.available_requests = min(self.requests_per_minute,
+                                      self.available_requests + elapsed * self.requests_per_minute / 60)
+        self.available_tokens = min(self.tokens_per_minute,
+                                    self.available_tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, estimated_tokens: int):
+        """Wait until one request and estimated_tokens are available, then consume them"""
+        # Holding the lock while sleeping keeps callers served in FIFO order
+        async with self.lock:
+            while True:
+                self.refill()
+                if self.available_requests >= 1 and self.available_tokens >= estimated_tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= estimated_tokens
+                    return
+
+                wait = max((1 - self.available_requests) * 60 / self.requests_per_minute,
+                           (estimated_tokens - self.available_tokens) * 60 / self.tokens_per_minute)
+                await asyncio.sleep(wait)
 
 class VietlottMegaOCR:
     def __init__(self, api_key: str = None):
         """Initialize with OpenAI API key"""
         if api_key:
-            self.client = OpenAI(api_key=api_key)
+            self.aclient = AsyncOpenAI(api_key=api_key)
         else:
             api_key = os.environ.get("OPENAI_API_KEY")
             if not api_key:
@@ -36,83 +175,205 @@ class VietlottMegaOCR:
                     "Get your API key from: https://platform.openai.com/api-keys\n"
                     "Then set it as: export OPENAI_API_KEY='your-api-key-here'"
                 )
-            self.client = OpenAI(api_key=api_key)
+            self.aclient = AsyncOpenAI(api_key=api_key)
 
         # Create directories
         os.makedirs(PDF_DIR, exist_ok=True)
         os.makedirs(IMAGE_DIR, exist_ok=True)
         os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+        self.cache_dir = Path(CACHE_DIR)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Shared HTTP session so page fetches reuse keep-alive connections
+        self.http = requests.Session()
+        self.http.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+        })
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                              raise_on_status=False),
+        )
+        self.http.mount('https://', adapter)
+
+        # Immutable request parts, built once and shared by every Vision call
+        self.prompt_part = {"type": "text", "text": OCR_PROMPT}
+        self.batch_prompt_parts = {
+            count: {"type": "text", "text": BATCH_OCR_PROMPT.format(count=count)}
+            for count in range(2, BATCH_SIZE + 1)
+        }
+        self.image_label_parts = [{"type": "text", "text": f"Image {index}:"} for index in range(1, BATCH_SIZE + 1)]
+
+        # Draw files are queued and written in batches across a small thread pool
+        self.pending_writes = []
+        self.write_failures = 0
+        self.writer = ThreadPoolExecutor(max_workers=8)
+
+        self.sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.download_sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        self.limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
         self.existing_draws = self.get_existing_draws()
         print(f"✓ OpenAI client initialized")
         print(f"✓ Found {len(self.existing_draws)} existing draws")
 
     def get_existing_draws(self) -> set:
         """Get set of existing draw IDs"""
-        existing = set()
-        output_path = Path(OUTPUT_DIR)
-        if output_path.exists():
-            for file in output_path.glob("mega_*.json"):
-                existing.add(file.stem)
-        return existing
-
-    def encode_image(self, image_path: str) -> str:
-        """Encode image to base64"""
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        try:
+            entries = os.scandir(OUTPUT_DIR)
+        except FileNotFoundError:
+            return set()
+
+        with entries:
+            return {entry.name[:-5] for entry in entries
+                    if entry.name.startswith("mega_") and entry.name.endswith(".json")}
+
+    def preprocess_image(self, image_bytes: bytes) -> bytes:
+        """Downscale the full result page, returns JPEG bytes"""
+        with Image.open(BytesIO(image_bytes)) as img:
+            img = img.convert("RGB")
+            img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+
+            buffer = BytesIO()
+            img.save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue()
+
+    async def load_image(self, image_path: str) -> bytes:
+        """Read and preprocess image"""
+        async with aiofiles.open(image_path, "rb") as image_file:
+            image_bytes = await image_file.read()
+        return await asyncio.to_thread(self.preprocess_image, image_bytes)
+
+    def encode_image(self, image_bytes: bytes) -> str:
+        """Encode preprocessed image bytes as a base64 data URL"""
+        # Concatenate as bytes and decode once; ASCII decoding is cheaper than UTF-8
+        return (b"data:image/jpeg;base64," + base64.b64encode(image_bytes)).decode('ascii')
+
+    def load_cached_response(self, cache_file: Path) -> Optional[dict]:
+        """Load a cached OCR response, or None on a cache miss"""
+        if not cache_file.exists():
+            return None
+        with open(cache_file) as f:
+            return json.load(f)
+
+    def save_cached_response(self, cache_file: Path, ocr_text: str, numbers: List[int], draw_date: Optional[datetime]):
+        """Atomically write the raw response and parsed fields to the OCR cache"""
+        entry = {
+            "ocr_text": ocr_text,
+            "numbers": numbers,
+            "draw_date": draw_date.isoformat() if draw_date else None,
+        }
+
+        tmp_file = cache_file.with_suffix(".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, cache_file)
+
+    def load_page_cache(self) -> dict:
+        """Load validators and parsed PDF links from the last fetch of each page"""
+        if not os.path.exists(PAGE_CACHE_FILE):
+            return {}
+        with open(PAGE_CACHE_FILE) as f:
+            return json.load(f)
+
+    def save_page_cache(self, page_cache: dict):
+        """Atomically write the page cache"""
+        tmp_file = f"{PAGE_CACHE_FILE}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(page_cache, f)
+        os.replace(tmp_file, PAGE_CACHE_FILE)
 
     def fetch_pdf_links(self) -> List[Tuple[int, str, datetime]]:
         """Fetch all PDF links from Vietlott announcement pages"""
-        print(f"\n=== Fetching PDF Links ===\n")
+        logger.info("=== Fetching PDF Links ===")
         all_pdfs = []
+        page_cache = self.load_page_cache()
 
         for page in range(1, TOTAL_PAGES + 1):
-            print(f"Fetching page {page}/{TOTAL_PAGES}...")
+            logger.info(f"Fetching page {page}/{TOTAL_PAGES}...")
 
             url = BASE_URL.format(page)
-            response = requests.get(url, headers={
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            }, timeout=30)
 
-            if response.status_code != 200:
-                print(f"  ✗ Failed to fetch page {page}: status {response.status_code}")
+            # Conditional GET so unchanged pages come back as an empty 304
+            cached = page_cache.get(url)
+            headers = {}
+            if cached:
+                if cached.get("etag"):
+                    headers['If-None-Match'] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers['If-Modified-Since'] = cached["last_modified"]
+
+            response = self.http.get(url, headers=headers, timeout=30)
+
+            if response.status_code == 304 and cached:
+                page_pdfs = [
+                    (draw_number, pdf_url, datetime.fromisoformat(draw_date) if draw_date else None)
+                    for draw_number, pdf_url, draw_date in cached["pdfs"]
+                ]
+                logger.info(f"  Page {page} not modified, using cached links")
+            elif response.status_code != 200:
+                logger.error(f"  ✗ Failed to fetch page {page}: status {response.status_code}")
                 continue
+            else:
+                page_pdfs = self.parse_pdf_links(response.text)
+
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if etag or last_modified:
+                    page_cache[url] = {
+                        "etag": etag,
+                        "last_modified": last_modified,
+                        "pdfs": [
+                            (draw_number, pdf_url, draw_date.isoformat() if draw_date else None)
+                            for draw_number, pdf_url, draw_date in page_pdfs
+                        ],
+                    }
+                else:
+                    # No validators to revalidate with, so drop any stale entry
+                    page_cache.pop(url, None)
 
-            # Extract PDF links from HTML
-            pdf_pattern = r'https://media\.vietlott\.vn/[^\s]*\[645\][^\s]*\.pdf'
-            pdf_matches = re.findall(pdf_pattern, response.text)
+            all_pdfs.extend(page_pdfs)
 
-            # Extract draw numbers and dates from the page
-            draw_pattern = r'\[645\]---(\d+)---'
-            date_pattern = r'Ngày\s+(\d{2})/(\d{2})/(\d{4})'
+            logger.info(f"  Found {len(page_pdfs)} PDFs on page {page}")
 
-            for pdf_url in pdf_matches:
-                draw_match = re.search(draw_pattern, pdf_url)
-                if not draw_match:
-                    continue
+            # An empty 304 costs the server next to nothing, so only pace full page downloads
+            if response.status_code != 304:
+                time.sleep(1)
 
-                draw_number = int(draw_match.group(1))
+        self.save_page_cache(page_cache)
 
-                # Try to find date near this PDF
-                # Find the context around this PDF URL
-                pdf_snippet = response.text[response.text.find(pdf_url)-200:response.text.find(pdf_url)+200]
-                date_match = re.search(date_pattern, pdf_snippet)
+        logger.info(f"Total PDFs found: {len(all_pdfs)}")
+        return all_pdfs
 
-                if date_match:
-                    day, month, year = map(int, date_match.groups())
-                    draw_date = datetime(year, month, day, 18, 0, 0)
-                else:
-                    draw_date = None
+    def parse_pdf_links(self, html: str) -> List[Tuple[int, str, Optional[datetime]]]:
+        """Extract draw numbers, PDF links, and nearby dates from an announcement page"""
+        # Index every "Ngày DD/MM/YYYY" once so each PDF can bisect to its nearby date
+        date_matches = list(_SNIPPET_DATE_RE.finditer(html)) if "Ngày" in html else []
+        date_starts = [m.start() for m in date_matches]
+
+        pdfs = []
+        for pdf_match in _PDF_RE.finditer(html):
+            pdf_url = pdf_match.group(0)
+            draw_match = _DRAW_RE.search(pdf_url)
+            if not draw_match:
+                continue
 
-                all_pdfs.append((draw_number, pdf_url, draw_date))
+            draw_number = int(draw_match.group(1))
 
-            print(f"  Found {len(pdf_matches)} PDFs on page {page}")
-            time.sleep(1)
+            # Take the first date within 200 characters either side of this PDF
+            start = pdf_match.start()
+            draw_date = None
+            i = bisect_left(date_starts, start - 200)
+            if i < len(date_matches) and date_matches[i].end() <= start + 200:
+                day, month, year = map(int, date_matches[i].groups())
+                draw_date = datetime(year, month, day, 18, 0, 0)
 
-        print(f"\nTotal PDFs found: {len(all_pdfs)}")
-        return all_pdfs
+            pdfs.append((draw_number, pdf_url, draw_date))
 
-    def download_pdf(self, draw_number: int, pdf_url: str) -> Optional[str]:
+        return pdfs
+
+    async def download_pdf(self, session: aiohttp.ClientSession, draw_number: int, pdf_url: str) -> Optional[str]:
         """Download PDF from URL"""
         pdf_path = os.path.join(PDF_DIR, f"draw_{draw_number:05d}.pdf")
 
@@ -120,129 +381,245 @@ class VietlottMegaOCR:
             return pdf_path
 
         try:
-            print(f"  [{draw_number:05d}] Downloading PDF...")
-            response = requests.get(pdf_url, headers={
-                'User-Agent': 'Mozilla/5.0 (compatible; tool_predict/1.0)'
-            }, timeout=30)
-
-            if response.status_code == 200:
-                with open(pdf_path, 'wb') as f:
-                    f.write(response.content)
-                return pdf_path
-            else:
-                print(f"  [{draw_number:05d}] ✗ Failed to download PDF: status {response.status_code}")
-                return None
+            async with self.download_sem:
+                logger.info(f"  [{draw_number:05d}] Downloading PDF...")
+                async with session.get(pdf_url) as response:
+                    if response.status != 200:
+                        logger.error(f"  [{draw_number:05d}] ✗ Failed to download PDF: status {response.status}")
+                        return None
+
+                    # Stream to a temp file so an interrupted download never looks complete
+                    tmp_path = f"{pdf_path}.part"
+                    async with aiofiles.open(tmp_path, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(65536):
+                            await f.write(chunk)
+                    os.replace(tmp_path, pdf_path)
+                    return pdf_path
         except Exception as e:
-            print(f"  [{draw_number:05d}] ✗ Error downloading PDF: {e}")
+            logger.error(f"  [{draw_number:05d}] ✗ Error downloading PDF: {e}")
             return None
 
-    def convert_pdf_to_image(self, pdf_path: str, draw_number: int) -> Optional[str]:
-        """Convert PDF to PNG image using pdftoppm"""
-        image_base = os.path.join(IMAGE_DIR, f"draw_{draw_number:05d}")
-        image_path = f"{image_base}.png"
+    @staticmethod
+    def convert_pdf_to_image(pdf_path: str, draw_number: int) -> str:
+        """Convert PDF to PNG image using pdf2image (runs in a worker process)"""
+        # Errors are raised back to the parent: the worker's log queue is never drained
+        image_name = f"draw_{draw_number:05d}"
+        image_path = os.path.join(IMAGE_DIR, f"{image_name}.png")
 
         if os.path.exists(image_path):
             return image_path
 
-        try:
-            # Use pdftoppm to convert
-            cmd = ["pdftoppm", "-png", "-singlefile", pdf_path, image_base]
-            result = subprocess.run(cmd, capture_output=True, text=True)
+        convert_from_path(
+            pdf_path,
+            output_folder=IMAGE_DIR,
+            output_file=image_name,
+            fmt="png",
+            single_file=True,
+            paths_only=True,
+        )
 
-            if result.returncode != 0:
-                print(f"  [{draw_number:05d}] ✗ pdftoppm failed: {result.stderr}")
-                return None
+        if not os.path.exists(image_path):
+            raise Exception("Image not created")
+
+        return image_path
+
+    @retry(
+        retry=retry_if_exception_type(RateLimitError),
+        wait=wait_exponential(min=1, max=30),
+        stop=stop_after_attempt(5),
+    )
+    async def create_completion(self, estimated_tokens: int = ESTIMATED_TOKENS_PER_REQUEST, **kwargs):
+        """Call the Chat Completions API, capped at MAX_CONCURRENT_REQUESTS in flight, throttled by the rate limiter and retried on 429"""
+        async with self.sem:
+            await self.limiter.acquire(estimated_tokens)
+            return await self.aclient.chat.completions.create(**kwargs)
+
+    async def request_ocr_text(self, image_bytes: bytes) -> str:
+        """Send a preprocessed image to ChatGPT Vision API and return the raw JSON response"""
+        image_part = {
+            "type": "image_url",
+            "image_url": {
+                "url": self.encode_image(image_bytes),
+                "detail": "high"
+            }
+        }
 
-            if not os.path.exists(image_path):
-                print(f"  [{draw_number:05d}] ✗ Image not created")
-                return None
+        response = await self.create_completion(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": [self.prompt_part, image_part]}],
+            response_format=DRAW_RESPONSE_FORMAT,
+            max_tokens=300,
+            temperature=0
+        )
 
-            return image_path
-        except Exception as e:
-            print(f"  [{draw_number:05d}] ✗ Error converting PDF: {e}")
+        # Strict json_schema replies carry a refusal instead of content; an empty text parses as a failed OCR
+        message = response.choices[0].message
+        if message.content is None:
+            logger.warning(f"  ⚠ ChatGPT refused the request: {message.refusal}")
+            return ""
+
+        return message.content.strip()
+
+    async def request_batch_ocr_texts(self, images: List[bytes]) -> Optional[List[str]]:
+        """Send several preprocessed images in one Vision request, returns None if the reply is unusable"""
+        count = len(images)
+        content = [self.batch_prompt_parts[count]]
+        for label_part, image_bytes in zip(self.image_label_parts, images):
+            content.append(label_part)
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": self.encode_image(image_bytes),
+                    "detail": "high"
+                }
+            })
+
+        response = await self.create_completion(
+            estimated_tokens=ESTIMATED_TOKENS_PER_REQUEST * count,
+            model="gpt-4o",
+            messages=[{"role": "user", "content": content}],
+            response_format=BATCH_RESPONSE_FORMAT,
+            max_tokens=800,
+            temperature=0
+        )
+
+        # Split into one single-draw JSON object per image so caching and parsing stay uniform
+        try:
+            data = json.loads(response.choices[0].message.content)
+            by_image = {entry["image"]: entry for entry in data["results"]}
+            return [
+                json.dumps({"date": by_image[index]["date"], "numbers": by_image[index]["numbers"]})
+                for index in range(1, count + 1)
+            ]
+        except (ValueError, KeyError, TypeError):
             return None
 
-    def extract_numbers_with_chatgpt(self, image_path: str, draw_number: int) -> Tuple[List[int], Optional[datetime]]:
-        """Extract winning numbers and date using ChatGPT Vision API"""
+    async def extract_batch_with_chatgpt_async(self, images: List[Tuple[int, str]]) -> List[Tuple[List[int], Optional[datetime]]]:
+        """Extract winning numbers and dates for (draw_number, image_path) pairs using ChatGPT Vision API"""
 
-        print(f"  [{draw_number:05d}] Analyzing with ChatGPT Vision...")
+        # Read and preprocess images; an unreadable image only fails its own draw
+        image_bytes = await asyncio.gather(*(self.load_image(path) for _, path in images), return_exceptions=True)
 
-        base64_image = self.encode_image(image_path)
+        # Identical image bytes always produce the same answer, so reuse earlier responses
+        cache_files = [None] * len(images)
+        ocr_texts = [None] * len(images)
+        misses = []
+        for i, data in enumerate(image_bytes):
+            if isinstance(data, Exception):
+                logger.error(f"  [{images[i][0]:05d}] ✗ Error loading image: {data}")
+                continue
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": (
-                                "This is a Vietlott Mega 6/45 lottery result image. "
-                                "Please extract:\n"
-                                "1. The draw date (ngày mở thưởng) - shown in DD/MM/YYYY format\n"
-                                "2. The 6 winning numbers\n\n"
-                                "The numbers range from 01 to 45 (not 55!). "
-                                "Look for numbers that are often:\n"
-                                "- Displayed in a grid or circle pattern\n"
-                                "- Separated by dashes, spaces, or arranged vertically\n"
-                                "- Sometimes labeled as 'Bộ số' (winning numbers)\n\n"
-                                "IMPORTANT: Only extract numbers between 01-45. If you see numbers like 46-55, "
-                                "those are from Power 6/55, not Mega 6/45. Look for the 6 main numbers.\n\n"
-                                "Return in this exact format:\n"
-                                "Date: DD/MM/YYYY\n"
-                                "Numbers: 01, 15, 23, 34, 42, 45"
-                            )
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=300,
-            temperature=0
-        )
+            cache_files[i] = self.cache_dir / f"{hashlib.sha256(data).hexdigest()}.json"
+            cached = self.load_cached_response(cache_files[i])
+            if cached is not None:
+                logger.info(f"  [{images[i][0]:05d}] Using cached ChatGPT response")
+                ocr_texts[i] = cached["ocr_text"]
+            else:
+                misses.append(i)
+
+        if misses:
+            for i in misses:
+                logger.info(f"  [{images[i][0]:05d}] Analyzing with ChatGPT Vision...")
+
+            # Send the misses together, falling back to one request per image if the batch reply is unusable
+            texts = None
+            if len(misses) > 1:
+                texts = await self.request_batch_ocr_texts([image_bytes[i] for i in misses])
+            if texts is None:
+                # Keep replies that succeeded even if another image in the group fails
+                texts = await asyncio.gather(*(self.request_ocr_text(image_bytes[i]) for i in misses),
+                                             return_exceptions=True)
+
+            for i, ocr_text in zip(misses, texts):
+                if isinstance(ocr_text, Exception):
+                    logger.error(f"  [{images[i][0]:05d}] ✗ Error: {ocr_text}")
+                    continue
+                logger.debug(f"  [{images[i][0]:05d}] ChatGPT Response: {ocr_text[:100]}...")
+                ocr_texts[i] = ocr_text
 
-        ocr_text = response.choices[0].message.content.strip()
-        print(f"  [{draw_number:05d}] ChatGPT Response: {ocr_text[:100]}...")
+        results = []
+        for i, ocr_text in enumerate(ocr_texts):
+            if ocr_text is None:
+                results.append(([], None))
+                continue
 
-        draw_date = self.parse_date_from_response(ocr_text)
-        numbers = self.parse_numbers_from_response(ocr_text)
+            # Parse date and numbers from response (re-parsed on cache hits so parser fixes apply)
+            numbers, draw_date = self.parse_ocr_response(ocr_text)
+
+            # Only cache complete parses so bad or truncated replies are retried on the next run
+            if i in misses and len(numbers) == 6 and draw_date is not None:
+                self.save_cached_response(cache_files[i], ocr_text, numbers, draw_date)
+
+            results.append((numbers, draw_date))
+
+        return results
+
+    def parse_ocr_response(self, text: str, lo: int = 1, hi: int = 45) -> Tuple[List[int], Optional[datetime]]:
+        """Parse numbers and date from a structured JSON response, returns ([], None) if the JSON is invalid"""
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            # Responses cached before structured output are plain "Date: ... Numbers: ..." text
+            return self.parse_numbers_from_response(text, lo, hi), self.parse_date_from_response(text)
+
+        # Valid JSON with a bad date or numbers is a failed OCR, never rescanned as text
+        try:
+            numbers = sorted(set(data["numbers"]))
+            draw_date = datetime.strptime(data["date"], "%d/%m/%Y").replace(hour=18)
+        except (ValueError, KeyError, TypeError):
+            return [], None
+
+        if len(numbers) != 6 or not all(isinstance(n, int) and lo <= n <= hi for n in numbers):
+            return [], None
 
         return numbers, draw_date
 
     def parse_date_from_response(self, text: str) -> Optional[datetime]:
         """Parse draw date from ChatGPT response"""
-        date_match = re.search(r'Date:\s*(\d{2})/(\d{2})/(\d{4})', text)
+        if "Date:" not in text:
+            return None
+
+        date_match = _DATE_RE.search(text)
         if date_match:
             day, month, year = map(int, date_match.groups())
             return datetime(year, month, day, 18, 0, 0)
         return None
 
-    def parse_numbers_from_response(self, text: str) -> List[int]:
-        """Parse 6 numbers from ChatGPT response"""
-        text = text.replace('-', ' ').replace(',', ' ').replace('  ', ' ')
-        parts = text.split()
+    def parse_numbers_from_response(self, text: str, lo: int = 1, hi: int = 45) -> List[int]:
+        """Parse 6 numbers from ChatGPT response in a single pass over the text"""
+
+        # Start after the "Numbers:" label so digits in the date line are not picked up
+        start = text.find("Numbers:")
+        if start < 0:
+            start = 0
 
         numbers = []
-        for part in parts:
-            match = re.search(r'\d+', part)
-            if match:
-                num = int(match.group())
-                if 1 <= num <= 45 and num not in numbers:  # Mega 6/45 range
+        seen = 0  # Bitmask of numbers already collected
+        num = 0
+        in_num = False
+        end = len(text)
+        for i in range(start, end + 1):
+            # Treat end of text as a separator so a trailing number is flushed
+            digit = ord(text[i]) - 48 if i < end else -1
+            if 0 <= digit <= 9:
+                num = num * 10 + digit
+                in_num = True
+            elif in_num:
+                if lo <= num <= hi and not (seen >> num) & 1:
+                    seen |= 1 << num
                     numbers.append(num)
                     if len(numbers) == 6:
                         break
+                num = 0
+                in_num = False
 
+        # Sort the numbers
         numbers.sort()
+
         return numbers
 
     def save_draw(self, draw_number: int, numbers: List[int], draw_date: datetime):
-        """Save draw to JSON file"""
+        """Serialize draw and queue it for the next batched write"""
         draw = {
             "id": f"mega_{draw_number:05d}",
             "game_type": "MEGA_6_45",
@@ -254,14 +631,102 @@ class VietlottMegaOCR:
         filename = f"mega_{draw_number:05d}.json"
         filepath = os.path.join(OUTPUT_DIR, filename)
 
-        with open(filepath, 'w') as f:
-            json.dump(draw, f, indent=2)
+        self.pending_writes.append((draw_number, numbers, filepath, orjson.dumps(draw, option=orjson.OPT_INDENT_2)))
+
+    @staticmethod
+    def write_file(filepath: str, data: bytes):
+        """Write bytes to a file (runs in the writer thread pool)"""
+        with open(filepath, 'wb') as f:
+            f.write(data)
+
+    async def flush_draws(self):
+        """Write all queued draw files in one batch across the writer thread pool, counting failed writes"""
+        writes, self.pending_writes = self.pending_writes, []
+        if not writes:
+            return
+
+        loop = asyncio.get_running_loop()
+        outcomes = await asyncio.gather(*(loop.run_in_executor(self.writer, self.write_file, filepath, data)
+                                          for _, _, filepath, data in writes), return_exceptions=True)
+
+        # Report each draw only once its file is actually on disk
+        for (draw_number, numbers, _, _), outcome in zip(writes, outcomes):
+            if isinstance(outcome, Exception):
+                self.write_failures += 1
+                logger.error(f"  [{draw_number:05d}] ✗ Error writing draw: {outcome}")
+            else:
+                logger.info(f"  [{draw_number:05d}] ✓ Saved: {numbers}")
+
+    def save_result(self, draw_number: int, numbers: List[int], draw_date: Optional[datetime]) -> bool:
+        """Queue a draw for saving if OCR found a date and 6 numbers, returns True if queued"""
+        if len(numbers) == 6 and draw_date is not None:
+            self.save_draw(draw_number, numbers, draw_date)
+            return True
+
+        if draw_date is None:
+            logger.warning(f"  [{draw_number:05d}] ⚠ Could not extract date")
+        if len(numbers) != 6:
+            logger.warning(f"  [{draw_number:05d}] ⚠ Could not extract 6 numbers (got {len(numbers)})")
+        return False
+
+    async def prepare_draw(self, session: aiohttp.ClientSession, pool: ProcessPoolExecutor,
+                           draw_number: int, pdf_url: str) -> Optional[str]:
+        """Download and convert a single draw, returns the image path"""
+        try:
+            # Download PDF
+            pdf_path = await self.download_pdf(session, draw_number, pdf_url)
+            if not pdf_path:
+                return None
+
+            # Convert to image in the process pool so conversions overlap with OCR calls
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(pool, self.convert_pdf_to_image, pdf_path, draw_number)
+            except Exception as e:
+                logger.error(f"  [{draw_number:05d}] ✗ Error converting PDF: {e}")
+                return None
+        except Exception as e:
+            logger.error(f"  [{draw_number:05d}] ✗ Error: {e}")
+            return None
 
-        print(f"  ✓ Saved: {numbers}")
+    async def process_batch(self, session: aiohttp.ClientSession, pool: ProcessPoolExecutor,
+                            batch: List[Tuple[int, str, Optional[datetime]]]) -> List[bool]:
+        """Download, convert, and OCR a batch of draws, returns True for each saved draw"""
+        image_paths = await asyncio.gather(
+            *(self.prepare_draw(session, pool, draw_number, pdf_url) for draw_number, pdf_url, _ in batch)
+        )
+        ready = [(draw_number, image_path, known_date)
+                 for (draw_number, _, known_date), image_path in zip(batch, image_paths) if image_path]
+        failed = [False] * (len(batch) - len(ready))
+
+        if not ready:
+            return failed
 
-    def process_all_draws(self, limit: int = None):
+        try:
+            # Extract numbers with ChatGPT Vision
+            results = await self.extract_batch_with_chatgpt_async(
+                [(draw_number, image_path) for draw_number, image_path, _ in ready]
+            )
+        except Exception as e:
+            for draw_number, _, _ in ready:
+                logger.error(f"  [{draw_number:05d}] ✗ Error: {e}")
+            return [False] * len(batch)
+
+        saved = []
+        for (draw_number, _, known_date), (numbers, draw_date) in zip(ready, results):
+            # Use known date if ChatGPT couldn't extract it
+            if draw_date is None and known_date:
+                draw_date = known_date
+            saved.append(self.save_result(draw_number, numbers, draw_date))
+
+        if len(self.pending_writes) >= WRITE_BATCH_SIZE:
+            await self.flush_draws()
+
+        return saved + failed
+
+    async def process_all_draws(self, limit: int = None):
         """Main workflow to download, convert, and OCR all draws"""
-        print("\n=== Starting Mega 6/45 OCR Pipeline ===\n")
+        logger.info("=== Starting Mega 6/45 OCR Pipeline ===")
 
         # Fetch all PDF links
         pdfs = self.fetch_pdf_links()
@@ -269,64 +734,58 @@ class VietlottMegaOCR:
         if limit:
             pdfs = pdfs[:limit]
 
-        total_draws = 0
-        saved_draws = 0
-        failed_draws = 0
-
+        pending = []
         for draw_number, pdf_url, known_date in pdfs:
             draw_id = f"mega_{draw_number:05d}"
-
             if draw_id in self.existing_draws:
-                print(f"  [{draw_number:05d}] Skipping (already exists)")
+                logger.info(f"  [{draw_number:05d}] Skipping (already exists)")
                 continue
-
-            try:
-                # Download PDF
-                pdf_path = self.download_pdf(draw_number, pdf_url)
-                if not pdf_path:
-                    failed_draws += 1
-                    continue
-
-                # Convert to image
-                image_path = self.convert_pdf_to_image(pdf_path, draw_number)
-                if not image_path:
-                    failed_draws += 1
-                    continue
-
-                # Extract numbers with ChatGPT Vision
-                numbers, draw_date = self.extract_numbers_with_chatgpt(image_path, draw_number)
-
-                # Use known date if ChatGPT couldn't extract it
-                if draw_date is None and known_date:
-                    draw_date = known_date
-
-                if len(numbers) == 6 and draw_date is not None:
-                    self.save_draw(draw_number, numbers, draw_date)
-                    saved_draws += 1
-                else:
-                    if draw_date is None:
-                        print(f"  [{draw_number:05d}] ⚠ Could not extract date")
-                    if len(numbers) != 6:
-                        print(f"  [{draw_number:05d}] ⚠ Could not extract 6 numbers (got {len(numbers)})")
-                    failed_draws += 1
-
-                total_draws += 1
-
-                # Rate limiting
-                time.sleep(1.5)
-
-            except Exception as e:
-                print(f"  [{draw_number:05d}] ✗ Error: {e}")
-                failed_draws += 1
-                continue
-
-        print(f"\n=== Summary ===")
-        print(f"Processed: {total_draws} draws")
-        print(f"Saved: {saved_draws} new draws")
-        print(f"Failed: {failed_draws} draws")
-        print(f"\nAPI Cost: ~${saved_draws * 0.01:.2f} USD (GPT-4o Vision: ~$0.01 per image)")
+            pending.append((draw_number, pdf_url, known_date))
+
+        # Send BATCH_SIZE draws per Vision request, capped at MAX_CONCURRENT_DOWNLOADS
+        # PDF fetches and MAX_CONCURRENT_REQUESTS in-flight Vision calls
+        batches = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+        timeout = aiohttp.ClientTimeout(total=30)
+        headers = {'User-Agent': 'Mozilla/5.0 (compatible; tool_predict/1.0)'}
+        async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
+            # Spawn workers rather than fork from inside the event loop while listener and executor threads run
+            with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn")) as pool:
+                try:
+                    batch_results = await asyncio.gather(*(self.process_batch(session, pool, batch) for batch in batches))
+                finally:
+                    await self.flush_draws()
+                    self.writer.shutdown()
+        results = [saved for batch in batch_results for saved in batch]
+
+        total_draws = len(results)
+        saved_draws = sum(results) - self.write_failures
+        failed_draws = total_draws - saved_draws
+
+        logger.info("=== Summary ===")
+        logger.info(f"Processed: {total_draws} draws")
+        logger.info(f"Saved: {saved_draws} new draws")
+        logger.info(f"Failed: {failed_draws} draws")
+        logger.info(f"API Cost: ~${saved_draws * 0.01:.2f} USD (GPT-4o Vision: ~$0.01 per image)")
+
+def setup_logging(verbose: bool = False) -> QueueListener:
+    """Route log records through a queue so async workers never block on terminal I/O"""
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    # Libraries (e.g. httpx request lines) only surface warnings; our progress is INFO, or DEBUG with --verbose
+    logging.basicConfig(level=logging.WARNING, handlers=[queue_handler])
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    listener = QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    return listener
 
 def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Vietlott Mega 6/45 ChatGPT Vision OCR")
+    parser.add_argument("--verbose", action="store_true", help="log raw ChatGPT responses")
+    args = parser.parse_args()
+    listener = setup_logging(args.verbose)
+
     print("=" * 60)
     print("Vietlott Mega 6/45 - ChatGPT Vision OCR Crawler")
     print("=" * 60)
@@ -353,7 +812,7 @@ def main():
             else:
                 print(f"\nProcessing {limit} draws...")
 
-        ocr.process_all_draws(limit=limit)
+        asyncio.run(ocr.process_all_draws(limit=limit))
 
     except Exception as e:
         print(f"\n✗ Error: {e}")
@@ -362,7 +821,9 @@ def main():
         print("   export OPENAI_API_KEY='sk-proj-...'")
         print("2. Get your API key from: https://platform.openai.com/api-keys")
         print("3. Install required packages:")
-        print("   pip3 install openai requests")
+        print("   pip3 install openai requests aiohttp aiofiles tenacity pillow pdf2image orjson")
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file